@@ -13,9 +13,49 @@ public class Thing {
         t.test = 12;
         System.out.println(t.hmmm(t).test);
         System.out.println(5.0);
+        System.out.println(sumOfSquares(2000));
+        System.out.println(mix(Long.MAX_VALUE / 3, 2));
+        Thing u = new Thing();
+        u.test = 33;
+        Thing s = new Special();
+        s.test = 22;
+        show(t, u);
+        show(t, u);
+        show(s, t);
+    }
+
+    static void show(Thing x, Thing y) {
+        System.out.println(x.name());
+        System.out.println(x.get(y));
+    }
+
+    public String name() {
+        return "Thing";
+    }
+
+    public int get(Thing other) {
+        return test;
+    }
+
+    static int sumOfSquares(int n) {
+        int total = 0;
+        for (int i = 0; i < n; i++) {
+            total += i * i;
+        }
+        return total;
+    }
+
+    static long mix(long x, int shift) {
+        return x * 31 / -7 >> shift;
     }
 
     public Thing hmmm(Thing other) {
         return other;
     }
 }
+
+class Special extends Thing {
+    public String name() {
+        return "Special";
+    }
+}
@@ -0,0 +1,486 @@
+"""
+Handlers of the instructions that only work on the operand stack and the
+locals: constants, loads, stores, arithmetic, conversions and comparisons.
+Every opcode has a function of its own that knows the types it works on,
+ints and longs are only wrapped around when a result leaves their range.
+"""
+import math
+import struct
+from collections import deque
+from functools import partial
+from typing import Callable, Sequence
+
+from enums import Opcode, StackTag, Superinstruction
+from bytecode import Instruction
+from infos import StackEntry
+
+Handler = Callable[[deque[StackEntry], list, tuple[int, ...]], None]
+
+INT_MIN, INT_MAX = -1 << 31, (1 << 31) - 1
+LONG_MIN, LONG_MAX = -1 << 63, (1 << 63) - 1
+
+
+def wrap_int(value: int) -> int:
+    return ((value + (1 << 31)) & 0xffffffff) - (1 << 31)
+
+
+def wrap_long(value: int) -> int:
+    return ((value + (1 << 63)) & 0xffffffffffffffff) - (1 << 63)
+
+
+def to_float(value: float) -> float:
+    """round a python float to the nearest 32 bit float"""
+    try:
+        return struct.unpack('>f', struct.pack('>f', value))[0]
+    except OverflowError:
+        return math.copysign(math.inf, value)
+
+
+def long_to_float(value: int) -> float:
+    """round an integer to the nearest 32 bit float in one step, float() would round to a double first"""
+    magnitude = abs(value)
+    shift = magnitude.bit_length() - 24
+    if shift > 0:
+        q, r = divmod(magnitude, 1 << shift)
+        half = 1 << (shift - 1)
+        if r > half or (r == half and q & 1):
+            q += 1
+        magnitude = q << shift
+    return float(-magnitude if value < 0 else magnitude)
+
+
+def to_integral(value: float, low: int, high: int) -> int:
+    """f2i, d2l and friends: NaN becomes 0, everything else is truncated and saturated"""
+    if math.isnan(value):
+        return 0
+    if value <= low:
+        return low
+    if value >= high:
+        return high
+    return int(value)
+
+
+def divide(a: float, b: float) -> float:
+    """floating point division the way IEEE 754 wants it, python raises instead"""
+    if b:
+        return a / b
+    if a == 0 or math.isnan(a):
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def remainder(a: float, b: float) -> float:
+    if not b or math.isinf(a) or math.isnan(a) or math.isnan(b):
+        return math.nan
+    return math.fmod(a, b)
+
+
+def int_quotient(a: int, b: int) -> int:
+    """division rounding towards zero"""
+    if not b:
+        raise ZeroDivisionError('/ by zero')
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def compare(a: float, b: float, nan: int) -> int:
+    if math.isnan(a) or math.isnan(b):
+        return nan
+    return (a > b) - (a < b)
+
+
+# constants
+
+def aconst_null(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Reference, None))
+
+def iconst_m1(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, -1))
+
+def iconst_0(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 0))
+
+def iconst_1(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 1))
+
+def iconst_2(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 2))
+
+def iconst_3(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 3))
+
+def iconst_4(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 4))
+
+def iconst_5(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, 5))
+
+def lconst_0(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Long, 0))
+
+def lconst_1(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Long, 1))
+
+def fconst_0(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, 0.0))
+
+def fconst_1(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, 1.0))
+
+def fconst_2(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, 2.0))
+
+def dconst_0(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, 0.0))
+
+def dconst_1(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, 1.0))
+
+def bipush(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, operands[0]))
+
+sipush = bipush
+
+
+# loads, the entries on the stack and in the locals are never changed in place,
+# so all types are loaded and stored by reference
+
+def load(stack, locals, operands):
+    stack.append(locals[operands[0]])
+
+def load_0(stack, locals, operands):
+    stack.append(locals[0])
+
+def load_1(stack, locals, operands):
+    stack.append(locals[1])
+
+def load_2(stack, locals, operands):
+    stack.append(locals[2])
+
+def load_3(stack, locals, operands):
+    stack.append(locals[3])
+
+
+# stores
+
+def store(stack, locals, operands):
+    locals[operands[0]] = stack.pop()
+
+def store_0(stack, locals, operands):
+    locals[0] = stack.pop()
+
+def store_1(stack, locals, operands):
+    locals[1] = stack.pop()
+
+def store_2(stack, locals, operands):
+    locals[2] = stack.pop()
+
+def store_3(stack, locals, operands):
+    locals[3] = stack.pop()
+
+
+def dup(stack, locals, operands):
+    stack.append(stack[-1])
+
+
+# int arithmetic
+
+def iadd(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data + b
+    stack.append(StackEntry(StackTag.Integer, r if INT_MIN <= r <= INT_MAX else wrap_int(r)))
+
+def isub(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data - b
+    stack.append(StackEntry(StackTag.Integer, r if INT_MIN <= r <= INT_MAX else wrap_int(r)))
+
+def imul(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data * b
+    stack.append(StackEntry(StackTag.Integer, r if INT_MIN <= r <= INT_MAX else wrap_int(r)))
+
+def idiv(stack, locals, operands):
+    b = stack.pop().data
+    r = int_quotient(stack.pop().data, b)
+    # MIN_VALUE / -1 is the only overflow
+    stack.append(StackEntry(StackTag.Integer, r if r <= INT_MAX else INT_MIN))
+
+def irem(stack, locals, operands):
+    b = stack.pop().data
+    a = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, a - int_quotient(a, b) * b))
+
+def ineg(stack, locals, operands):
+    a = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, -a if a != INT_MIN else a))
+
+def ishl(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, wrap_int(stack.pop().data << (b & 31))))
+
+def ishr(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, stack.pop().data >> (b & 31)))
+
+def iushr(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, wrap_int((stack.pop().data & 0xffffffff) >> (b & 31))))
+
+def iand(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, stack.pop().data & b))
+
+def ior(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, stack.pop().data | b))
+
+def ixor(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, stack.pop().data ^ b))
+
+def iinc(stack, locals, operands):
+    index, const = operands
+    r = locals[index].data + const
+    locals[index] = StackEntry(StackTag.Integer, r if INT_MIN <= r <= INT_MAX else wrap_int(r))
+
+
+# long arithmetic
+
+def ladd(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data + b
+    stack.append(StackEntry(StackTag.Long, r if LONG_MIN <= r <= LONG_MAX else wrap_long(r)))
+
+def lsub(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data - b
+    stack.append(StackEntry(StackTag.Long, r if LONG_MIN <= r <= LONG_MAX else wrap_long(r)))
+
+def lmul(stack, locals, operands):
+    b = stack.pop().data
+    r = stack.pop().data * b
+    stack.append(StackEntry(StackTag.Long, r if LONG_MIN <= r <= LONG_MAX else wrap_long(r)))
+
+def ldiv(stack, locals, operands):
+    b = stack.pop().data
+    r = int_quotient(stack.pop().data, b)
+    stack.append(StackEntry(StackTag.Long, r if r <= LONG_MAX else LONG_MIN))
+
+def lrem(stack, locals, operands):
+    b = stack.pop().data
+    a = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, a - int_quotient(a, b) * b))
+
+def lneg(stack, locals, operands):
+    a = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, -a if a != LONG_MIN else a))
+
+def lshl(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, wrap_long(stack.pop().data << (b & 63))))
+
+def lshr(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, stack.pop().data >> (b & 63)))
+
+def lushr(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, wrap_long((stack.pop().data & 0xffffffffffffffff) >> (b & 63))))
+
+def land(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, stack.pop().data & b))
+
+def lor(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, stack.pop().data | b))
+
+def lxor(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Long, stack.pop().data ^ b))
+
+
+# float arithmetic, every result is rounded back to 32 bits
+
+def fadd(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Float, to_float(stack.pop().data + b)))
+
+def fsub(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Float, to_float(stack.pop().data - b)))
+
+def fmul(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Float, to_float(stack.pop().data * b)))
+
+def fdiv(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Float, to_float(divide(stack.pop().data, b))))
+
+def frem(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Float, to_float(remainder(stack.pop().data, b))))
+
+def fneg(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, -stack.pop().data))
+
+
+# double arithmetic
+
+def dadd(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Double, stack.pop().data + b))
+
+def dsub(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Double, stack.pop().data - b))
+
+def dmul(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Double, stack.pop().data * b))
+
+def ddiv(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Double, divide(stack.pop().data, b)))
+
+def drem(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Double, remainder(stack.pop().data, b)))
+
+def dneg(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, -stack.pop().data))
+
+
+# conversions
+
+def i2l(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Long, stack.pop().data))
+
+def i2f(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, to_float(float(stack.pop().data))))
+
+def i2d(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, float(stack.pop().data)))
+
+def l2i(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, wrap_int(stack.pop().data)))
+
+def l2f(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, long_to_float(stack.pop().data)))
+
+def l2d(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, float(stack.pop().data)))
+
+def f2i(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, to_integral(stack.pop().data, INT_MIN, INT_MAX)))
+
+def f2l(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Long, to_integral(stack.pop().data, LONG_MIN, LONG_MAX)))
+
+def f2d(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Double, stack.pop().data))
+
+def d2i(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, to_integral(stack.pop().data, INT_MIN, INT_MAX)))
+
+def d2l(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Long, to_integral(stack.pop().data, LONG_MIN, LONG_MAX)))
+
+def d2f(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Float, to_float(stack.pop().data)))
+
+def i2b(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, ((stack.pop().data + 0x80) & 0xff) - 0x80))
+
+def i2c(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, stack.pop().data & 0xffff))
+
+def i2s(stack, locals, operands):
+    stack.append(StackEntry(StackTag.Integer, ((stack.pop().data + 0x8000) & 0xffff) - 0x8000))
+
+
+# comparisons
+
+def lcmp(stack, locals, operands):
+    b = stack.pop().data
+    a = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, (a > b) - (a < b)))
+
+def fcmpl(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, compare(stack.pop().data, b, -1)))
+
+def fcmpg(stack, locals, operands):
+    b = stack.pop().data
+    stack.append(StackEntry(StackTag.Integer, compare(stack.pop().data, b, 1)))
+
+dcmpl = fcmpl
+dcmpg = fcmpg
+
+
+HANDLERS: dict[Opcode | Superinstruction, Handler] = {
+    Opcode.aconst_null: aconst_null,
+    Opcode.iconst_m1: iconst_m1,
+    Opcode.iconst_0: iconst_0,
+    Opcode.iconst_1: iconst_1,
+    Opcode.iconst_2: iconst_2,
+    Opcode.iconst_3: iconst_3,
+    Opcode.iconst_4: iconst_4,
+    Opcode.iconst_5: iconst_5,
+    Opcode.lconst_0: lconst_0,
+    Opcode.lconst_1: lconst_1,
+    Opcode.fconst_0: fconst_0,
+    Opcode.fconst_1: fconst_1,
+    Opcode.fconst_2: fconst_2,
+    Opcode.dconst_0: dconst_0,
+    Opcode.dconst_1: dconst_1,
+    Opcode.bipush: bipush,
+    Opcode.sipush: sipush,
+    Opcode.dup: dup,
+    Opcode.iinc: iinc,
+    **{op: load for op in (Opcode.iload, Opcode.lload, Opcode.fload, Opcode.dload, Opcode.aload)},
+    **{op: load_0 for op in (Opcode.iload_0, Opcode.lload_0, Opcode.fload_0, Opcode.dload_0, Opcode.aload_0)},
+    **{op: load_1 for op in (Opcode.iload_1, Opcode.lload_1, Opcode.fload_1, Opcode.dload_1, Opcode.aload_1)},
+    **{op: load_2 for op in (Opcode.iload_2, Opcode.lload_2, Opcode.fload_2, Opcode.dload_2, Opcode.aload_2)},
+    **{op: load_3 for op in (Opcode.iload_3, Opcode.lload_3, Opcode.fload_3, Opcode.dload_3, Opcode.aload_3)},
+    **{op: store for op in (Opcode.istore, Opcode.lstore, Opcode.fstore, Opcode.dstore, Opcode.astore)},
+    **{op: store_0 for op in (Opcode.istore_0, Opcode.lstore_0, Opcode.fstore_0, Opcode.dstore_0, Opcode.astore_0)},
+    **{op: store_1 for op in (Opcode.istore_1, Opcode.lstore_1, Opcode.fstore_1, Opcode.dstore_1, Opcode.astore_1)},
+    **{op: store_2 for op in (Opcode.istore_2, Opcode.lstore_2, Opcode.fstore_2, Opcode.dstore_2, Opcode.astore_2)},
+    **{op: store_3 for op in (Opcode.istore_3, Opcode.lstore_3, Opcode.fstore_3, Opcode.dstore_3, Opcode.astore_3)},
+    Opcode.iadd: iadd, Opcode.ladd: ladd, Opcode.fadd: fadd, Opcode.dadd: dadd,
+    Opcode.isub: isub, Opcode.lsub: lsub, Opcode.fsub: fsub, Opcode.dsub: dsub,
+    Opcode.imul: imul, Opcode.lmul: lmul, Opcode.fmul: fmul, Opcode.dmul: dmul,
+    Opcode.idiv: idiv, Opcode.ldiv: ldiv, Opcode.fdiv: fdiv, Opcode.ddiv: ddiv,
+    Opcode.irem: irem, Opcode.lrem: lrem, Opcode.frem: frem, Opcode.drem: drem,
+    Opcode.ineg: ineg, Opcode.lneg: lneg, Opcode.fneg: fneg, Opcode.dneg: dneg,
+    Opcode.ishl: ishl, Opcode.lshl: lshl,
+    Opcode.ishr: ishr, Opcode.lshr: lshr,
+    Opcode.iushr: iushr, Opcode.lushr: lushr,
+    Opcode.iand: iand, Opcode.land: land,
+    Opcode.ior: ior, Opcode.lor: lor,
+    Opcode.ixor: ixor, Opcode.lxor: lxor,
+    Opcode.i2l: i2l, Opcode.i2f: i2f, Opcode.i2d: i2d,
+    Opcode.l2i: l2i, Opcode.l2f: l2f, Opcode.l2d: l2d,
+    Opcode.f2i: f2i, Opcode.f2l: f2l, Opcode.f2d: f2d,
+    Opcode.d2i: d2i, Opcode.d2l: d2l, Opcode.d2f: d2f,
+    Opcode.i2b: i2b, Opcode.i2c: i2c, Opcode.i2s: i2s,
+    Opcode.lcmp: lcmp,
+    Opcode.fcmpl: fcmpl, Opcode.fcmpg: fcmpg,
+    Opcode.dcmpl: dcmpl, Opcode.dcmpg: dcmpg,
+}
+
+
+def run_parts(parts: tuple[tuple[Handler, tuple[int, ...]], ...], stack, locals, operands):
+    for handler, part_operands in parts:
+        handler(stack, locals, part_operands)
+
+
+def fused(parts: Sequence[Instruction]) -> Handler:
+    """handler of a Superinstruction.fused, running the handlers of `parts` in order"""
+    for part in parts:
+        if part.opcode not in HANDLERS:
+            raise ValueError(f'{part.opcode} has no handler, it needs a superinstruction of its own')
+    return partial(run_parts, tuple((HANDLERS[part.opcode], part.operands) for part in parts))
@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Iterable, Optional
+
+from enums import Opcode, Superinstruction
+from utils import *
+
+
+def parse_cp_byte(f: BinaryIO) -> int:
+    return parse_int(f, 1) - 1
+
+
+def parse_byte(f: BinaryIO) -> int:
+    return parse_int(f, 1)
+
+
+def parse_short(f: BinaryIO) -> int:
+    return parse_int(f, 2)
+
+
+def parse_signed_byte(f: BinaryIO) -> int:
+    return parse_signed(f, 1)
+
+
+def parse_signed_short(f: BinaryIO) -> int:
+    return parse_signed(f, 2)
+
+
+# how to read the operands following each opcode; opcodes not listed here take none
+OPERANDS: dict[Opcode, tuple[Callable[[BinaryIO], int], ...]] = {
+    Opcode.getstatic:     (parse_cp_index,),
+    Opcode.ldc:           (parse_cp_byte,),
+    Opcode.ldc_w:         (parse_cp_index,),
+    Opcode.ldc2_w:        (parse_cp_index,),
+    Opcode.invokevirtual: (parse_cp_index,),
+    Opcode.invokespecial: (parse_cp_index,),
+    Opcode.new:           (parse_cp_index,),
+    Opcode.putfield:      (parse_cp_index,),
+    Opcode.getfield:      (parse_cp_index,),
+    Opcode.invokestatic:  (parse_cp_index,),
+    Opcode.sipush:        (parse_signed_short,),
+    Opcode.bipush:        (parse_signed_byte,),
+    Opcode.iinc:          (parse_byte, parse_signed_byte),
+    **{op: (parse_byte,) for op in (
+        Opcode.iload, Opcode.lload, Opcode.fload, Opcode.dload, Opcode.aload,
+        Opcode.istore, Opcode.lstore, Opcode.fstore, Opcode.dstore, Opcode.astore,
+    )},
+}
+
+# operands of the instructions following a wide prefix, which only widens them
+WIDE_OPERANDS: dict[Opcode, tuple[Callable[[BinaryIO], int], ...]] = {
+    Opcode.iinc: (parse_short, parse_signed_short),
+    **{op: (parse_short,) for op in (
+        Opcode.iload, Opcode.lload, Opcode.fload, Opcode.dload, Opcode.aload,
+        Opcode.istore, Opcode.lstore, Opcode.fstore, Opcode.dstore, Opcode.astore,
+    )},
+}
+
+# the operand of these is the offset of the target, after linking it is the
+# index of the target instruction
+BRANCHES = {
+    Opcode.ifeq, Opcode.ifne, Opcode.iflt, Opcode.ifge, Opcode.ifgt, Opcode.ifle,
+    Opcode.if_icmpeq, Opcode.if_icmpne, Opcode.if_icmplt, Opcode.if_icmpge, Opcode.if_icmpgt, Opcode.if_icmple,
+    Opcode.goto,
+}
+OPERANDS.update({op: (parse_signed_short,) for op in BRANCHES})
+
+
+# sequences fused into a single superinstruction by the peephole pass, the
+# operands of the fused instruction are the operands of its parts in order.
+# Superinstruction.fused runs the handlers of its parts one after the other,
+# so any sequence of instructions with handlers only needs an entry here.
+# sequences that also call, allocate or touch fields need a superinstruction
+# of their own with a case in MethodInfo.execute
+PEEPHOLE_PATTERNS: dict[tuple[Opcode, ...], Superinstruction] = {
+    (Opcode.iload_1, Opcode.iload_2, Opcode.iadd):         Superinstruction.fused,
+    (Opcode.iadd, Opcode.istore_1):                        Superinstruction.fused,
+    (Opcode.aload_0, Opcode.getfield):                     Superinstruction.aload_0_getfield,
+    **{(Opcode.aload_0, load, Opcode.putfield):            Superinstruction.aload_0_load_1_putfield for load in (
+        Opcode.aload_1, Opcode.iload_1, Opcode.lload_1, Opcode.fload_1, Opcode.dload_1,
+    )},
+    (Opcode.new, Opcode.dup, Opcode.invokespecial):        Superinstruction.new_dup_invokespecial,
+    (Opcode.getstatic, Opcode.ldc, Opcode.invokevirtual): Superinstruction.getstatic_ldc_invokevirtual,
+}
+
+
+@dataclass(slots=True)
+class Instruction:
+    opcode: Opcode | Superinstruction
+    operands: tuple[int, ...] = ()
+    pc: int = 0
+    # per call site state, filled in by the interpreter on first execution
+    cache: Any = None
+    # specialized function running this instruction, if it only needs the stack and locals
+    handler: Optional[Callable] = None
+    # the instructions a superinstruction was fused from
+    parts: tuple["Instruction", ...] = ()
+
+
+def decode(bytecode: bytes) -> list[Instruction]:
+    res = []
+    with BytesIO(bytecode) as f:
+        while (pc := f.tell()) < len(bytecode):
+            opcode = Opcode(f.read(1)[0])
+            if opcode == Opcode.wide:
+                # decoded as the widened instruction itself, so nothing else has to know about it
+                opcode = Opcode(f.read(1)[0])
+                if opcode not in WIDE_OPERANDS:
+                    raise ValueError(f'unexpected Opcode after wide: {opcode}')
+                operands = tuple(parse(f) for parse in WIDE_OPERANDS[opcode])
+            else:
+                operands = tuple(parse(f) for parse in OPERANDS.get(opcode, ()))
+            res.append(Instruction(opcode, operands, pc))
+    return res
+
+
+def fuse(instructions: list[Instruction], barriers: Iterable[int] = (),
+         patterns: dict[tuple[Opcode, ...], Superinstruction] = PEEPHOLE_PATTERNS) -> list[Instruction]:
+    """
+    Replace the sequences in `patterns` by their superinstructions.
+    No instruction at a pc in `barriers` (i.e. a jump target) is fused into
+    the middle of a sequence, so every target stays addressable.
+    """
+    barriers = set(barriers)
+    by_length = sorted(patterns.items(), key=lambda p: len(p[0]), reverse=True)
+    res = []
+    i = 0
+    while i < len(instructions):
+        for pattern, superinstruction in by_length:
+            window = instructions[i:i + len(pattern)]
+            if (tuple(ins.opcode for ins in window) == pattern
+                    and not any(ins.pc in barriers for ins in window[1:])):
+                operands = tuple(op for ins in window for op in ins.operands)
+                res.append(Instruction(superinstruction, operands, window[0].pc, parts=tuple(window)))
+                i += len(pattern)
+                break
+        else:
+            res.append(instructions[i])
+            i += 1
+    return res
+
+
+def branch_targets(instructions: list[Instruction]) -> set[int]:
+    return {ins.pc + ins.operands[0] for ins in instructions if ins.opcode in BRANCHES}
+
+
+def link_branches(instructions: list[Instruction]) -> list[Instruction]:
+    """point the branches at the index of their target in `instructions`"""
+    index = {ins.pc: i for i, ins in enumerate(instructions)}
+    for ins in instructions:
+        if ins.opcode in BRANCHES:
+            ins.operands = (index[ins.pc + ins.operands[0]],)
+    return instructions
@@ -83,6 +83,162 @@ class Opcode(Enum):
     nop             = 0
     iconst_1        = 4
     dconst_1        = 15
+    # constants
+    aconst_null     = 0x01
+    iconst_m1       = 0x02
+    iconst_0        = 0x03
+    iconst_2        = 0x05
+    iconst_3        = 0x06
+    iconst_4        = 0x07
+    iconst_5        = 0x08
+    lconst_0        = 0x09
+    lconst_1        = 0x0a
+    fconst_0        = 0x0b
+    fconst_1        = 0x0c
+    fconst_2        = 0x0d
+    dconst_0        = 0x0e
+    ldc_w           = 0x13
+    # loads
+    iload           = 0x15
+    lload           = 0x16
+    fload           = 0x17
+    dload           = 0x18
+    aload           = 0x19
+    iload_0         = 0x1a
+    iload_1         = 0x1b
+    iload_2         = 0x1c
+    iload_3         = 0x1d
+    lload_0         = 0x1e
+    lload_1         = 0x1f
+    lload_2         = 0x20
+    lload_3         = 0x21
+    fload_0         = 0x22
+    fload_1         = 0x23
+    fload_2         = 0x24
+    fload_3         = 0x25
+    dload_0         = 0x26
+    dload_1         = 0x27
+    dload_2         = 0x28
+    dload_3         = 0x29
+    aload_2         = 0x2c
+    aload_3         = 0x2d
+    # stores
+    istore          = 0x36
+    lstore          = 0x37
+    fstore          = 0x38
+    dstore          = 0x39
+    astore          = 0x3a
+    istore_0        = 0x3b
+    istore_1        = 0x3c
+    istore_2        = 0x3d
+    istore_3        = 0x3e
+    lstore_0        = 0x3f
+    lstore_1        = 0x40
+    lstore_2        = 0x41
+    lstore_3        = 0x42
+    fstore_0        = 0x43
+    fstore_1        = 0x44
+    fstore_2        = 0x45
+    fstore_3        = 0x46
+    dstore_0        = 0x47
+    dstore_1        = 0x48
+    dstore_3        = 0x4a
+    astore_2        = 0x4d
+    astore_3        = 0x4e
+    # arithmetic
+    iadd            = 0x60
+    ladd            = 0x61
+    fadd            = 0x62
+    dadd            = 0x63
+    isub            = 0x64
+    lsub            = 0x65
+    fsub            = 0x66
+    dsub            = 0x67
+    imul            = 0x68
+    lmul            = 0x69
+    fmul            = 0x6a
+    dmul            = 0x6b
+    idiv            = 0x6c
+    ldiv            = 0x6d
+    fdiv            = 0x6e
+    ddiv            = 0x6f
+    irem            = 0x70
+    lrem            = 0x71
+    frem            = 0x72
+    drem            = 0x73
+    ineg            = 0x74
+    lneg            = 0x75
+    fneg            = 0x76
+    dneg            = 0x77
+    ishl            = 0x78
+    lshl            = 0x79
+    ishr            = 0x7a
+    lshr            = 0x7b
+    iushr           = 0x7c
+    lushr           = 0x7d
+    iand            = 0x7e
+    land            = 0x7f
+    ior             = 0x80
+    lor             = 0x81
+    ixor            = 0x82
+    lxor            = 0x83
+    iinc            = 0x84
+    # conversions
+    i2l             = 0x85
+    i2f             = 0x86
+    i2d             = 0x87
+    l2i             = 0x88
+    l2d             = 0x8a
+    f2i             = 0x8b
+    f2l             = 0x8c
+    f2d             = 0x8d
+    d2i             = 0x8e
+    d2l             = 0x8f
+    d2f             = 0x90
+    i2b             = 0x91
+    i2c             = 0x92
+    i2s             = 0x93
+    # comparisons
+    lcmp            = 0x94
+    fcmpl           = 0x95
+    fcmpg           = 0x96
+    dcmpl           = 0x97
+    dcmpg           = 0x98
+    ifeq            = 0x99
+    ifne            = 0x9a
+    iflt            = 0x9b
+    ifge            = 0x9c
+    ifgt            = 0x9d
+    ifle            = 0x9e
+    if_icmpeq       = 0x9f
+    if_icmpne       = 0xa0
+    if_icmplt       = 0xa1
+    if_icmpge       = 0xa2
+    if_icmpgt       = 0xa3
+    if_icmple       = 0xa4
+    goto            = 0xa7
+    # control
+    ireturn         = 0xac
+    lreturn         = 0xad
+    freturn         = 0xae
+    dreturn         = 0xaf
+    invokestatic    = 0xb8
+    # prefix widening the local index (and the iinc constant) of the next instruction
+    wide            = 0xc4
+
+
+class Superinstruction(Enum):
+    # any sequence of instructions with handlers, running them in order
+    fused                       = auto()
+    # sequences with a body of their own
+    aload_0_getfield            = auto()
+    aload_0_load_1_putfield     = auto()
+    new_dup_invokespecial       = auto()
+    getstatic_ldc_invokevirtual = auto()
+    # invokevirtual of a trivial method, inlined behind a class guard
+    inlined_return_argument     = auto()
+    inlined_getter              = auto()
+    inlined_setter              = auto()
 
 
 class InitializationState(Enum):
@@ -97,4 +253,6 @@ class StackTag(Enum):
     Reference = auto()
     Integer = auto()
     Float = auto()
+    Long = auto()
+    Double = auto()
 
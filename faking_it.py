@@ -3,11 +3,14 @@
 from collections import deque
 from dataclasses import dataclass, field
 from types import FunctionType
-from typing import Callable, Generic, TypeVar
-from inspect import signature
+from typing import Callable, Generic, TypeVar, TYPE_CHECKING
+from inspect import isawaitable, signature
 
-from enums import Access, CPInfoTag, InitializationState
-from infos import ClassFile, ConstantPoolInfo, FieldInfo, AttributeInfo, MethodInfo, Utf8Info, ClassInfo, StackEntry
+from enums import Access, CPInfoTag
+from infos import ClassFile, ConstantPoolInfo, FieldInfo, AttributeInfo, MethodInfo, Utf8Info, ClassInfo, StackEntry, Frame
+
+if TYPE_CHECKING:
+    from vm import VM
 
 
 T = TypeVar('T')
@@ -38,20 +41,31 @@ def export(signature: bytes, num_args: int, name: str=None):
 
 @dataclass
 class StaticField(Generic[T]):
-    value: T
+    value: T | None = None
+    # called instead to create the value for every VM, for state that must not be shared
+    factory: Callable[["VM"], T] | None = None
+
+    def initial(self, vm: "VM") -> T | None:
+        if self.factory is not None:
+            return self.factory(vm)
+        return self.value
 
 
 class PrintStream:
+    def __init__(self, vm: "VM"):
+        self.vm = vm
+
     @export(b'(Ljava/lang/String;)V', 1)
     @export(b'(D)V', 1)
     @export(b'(F)V', 1)
     @export(b'(I)V', 1)
+    @export(b'(J)V', 1)
     def println(self, x):
-        print(x)
+        print(x, file=self.vm.stdout)
 
 
 class System:
-    out = StaticField(PrintStream())
+    out = StaticField(factory=PrintStream)
 
 
 class Object:
@@ -65,8 +79,14 @@ class FakeMethod(MethodInfo):
     access_flags = Access.PUBLIC | Access.NATIVE
     original_function: Callable = lambda self: None
     arg_count: int = 0
-    def run(self, cls: "ClassFile", stack: deque, args: list[StackEntry]):
-        self.original_function(*(a.data for a in args))
+    def execute(self, vm: "VM", stack: deque, args: list[StackEntry]) -> Frame:
+        result = self.original_function(*(a.data for a in args))
+        if isawaitable(result):
+            # async natives are awaited by whoever drives the VM
+            result = yield result
+        assert self.signature
+        if self.signature[1] != b'V':
+            stack.append(StackEntry.from_value(result))
 
 
 @dataclass
@@ -80,8 +100,6 @@ class FakeClass(ClassFile):
     minor_version = 0
     major_version = 0
     this_class=0
-    def initialize(self, *_):
-        return
 
 
 def build_class(cls: type, name: bytes) -> ClassFile:
@@ -93,7 +111,7 @@ def build_class(cls: type, name: bytes) -> ClassFile:
     attributes: list[FieldInfo] = []
     static_fields: dict[bytes, object] = {}
     count = len(constants)
-    clazz = FakeClass(constant_pool=constants, this_class=2, fields=attributes, methods=methods, initialized=InitializationState.done, static_fields=static_fields)
+    clazz = FakeClass(constant_pool=constants, this_class=2, fields=attributes, methods=methods, static_fields=static_fields)
     for k, v in cls.__dict__.items():
         if isinstance(v, ToExport):
             if v.name is not None:
@@ -109,7 +127,7 @@ def build_class(cls: type, name: bytes) -> ClassFile:
             constants.append(Utf8Info(k.encode('utf-8')))
             attributes.append(FakeField(name_index=count-1, descriptor_index=1))
             if isinstance(v, StaticField):
-                static_fields[k.encode()] = v.value
+                static_fields[k.encode()] = v
     return clazz
 
 
@@ -0,0 +1,133 @@
+import gc
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from enums import Access
+from infos import ClassFile, Instance, StackEntry, Utf8Info
+
+# estimates of the layout of a 64 bit HotSpot VM with compressed oops
+HEADER_SIZE = 12
+ALIGNMENT = 8
+FIELD_SIZES = {
+    b'B': 1, b'Z': 1,
+    b'C': 2, b'S': 2,
+    b'I': 4, b'F': 4,
+    b'J': 8, b'D': 8,
+    b'L': 4, b'[': 4,
+}
+
+
+class OutOfMemoryError(MemoryError):
+    """java.lang.OutOfMemoryError, thrown into the guest when its heap is full"""
+
+
+def parse_size(size: int | str) -> int:
+    """sizes as given to -Xmx, e.g. 512k, 64m or 2g"""
+    if isinstance(size, int):
+        return size
+    units = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+    if size[-1:].lower() in units:
+        return int(size[:-1]) * units[size[-1].lower()]
+    return int(size)
+
+
+def instance_size(klass: ClassFile) -> int:
+    size = HEADER_SIZE
+    k: Optional[ClassFile] = klass
+    while k is not None:
+        for field in k.fields:
+            if Access.STATIC not in field.access_flags:
+                size += FIELD_SIZES.get(k.get_const(field.descriptor_index, Utf8Info).bytes[:1], 4)
+        k = k.superclass
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+@dataclass(slots=True)
+class ClassStats:
+    heap: "Heap"
+    name: bytes
+    size: int
+    live_instances: int = 0
+    total_instances: int = 0
+
+    @property
+    def live_bytes(self) -> int:
+        return self.live_instances * self.size
+
+    @property
+    def total_bytes(self) -> int:
+        return self.total_instances * self.size
+
+
+class Heap:
+    """
+    Keeps count of the objects of a VM. Instances are freed when python
+    frees them, so the live numbers are exact as soon as no frame refers to
+    an object any more.
+    """
+
+    def __init__(self, max_size: int | str | None = None):
+        self.max_size = None if max_size is None else parse_size(max_size)
+        self.live_bytes = 0
+        self.classes: dict[bytes, ClassStats] = {}
+
+    def allocate(self, klass: ClassFile) -> Instance:
+        name = klass.class_name
+        stats = self.classes.get(name)
+        if stats is None:
+            stats = self.classes[name] = ClassStats(self, name, instance_size(klass))
+        if self.max_size is not None and self.live_bytes + stats.size > self.max_size:
+            # garbage in reference cycles is only found by the collector
+            gc.collect()
+            if self.live_bytes + stats.size > self.max_size:
+                raise OutOfMemoryError('Java heap space')
+        instance = klass.new_instance()
+        instance.stats = stats
+        stats.live_instances += 1
+        stats.total_instances += 1
+        self.live_bytes += stats.size
+        return instance
+
+    def free(self, stats: ClassStats):
+        stats.live_instances -= 1
+        self.live_bytes -= stats.size
+
+    def recount(self, roots: Iterable):
+        """
+        Count the live objects again, starting from `roots`.
+        Needed after restoring a snapshot, which holds only the objects
+        that were still reachable.
+        """
+        for stats in self.classes.values():
+            stats.live_instances = 0
+        self.live_bytes = 0
+        seen: set[int] = set()
+        todo = list(roots)
+        while todo:
+            match todo.pop():
+                case Instance() as obj if id(obj) not in seen:
+                    seen.add(id(obj))
+                    if obj.stats is not None and obj.stats.heap is self:
+                        obj.stats.live_instances += 1
+                        self.live_bytes += obj.stats.size
+                    todo.extend(obj.fields.values())
+                case StackEntry(_, data):
+                    todo.append(data)
+                case dict() as d:
+                    todo.extend(d.values())
+                case list() | tuple() as l:
+                    todo.extend(l)
+
+    def histogram(self) -> str:
+        """live objects per class, formatted like jmap -histo"""
+        lines = [
+            ' num     #instances         #bytes  class name',
+            '----------------------------------------------',
+        ]
+        live = sorted((s for s in self.classes.values() if s.live_instances),
+                      key=lambda s: s.live_bytes, reverse=True)
+        for num, stats in enumerate(live, 1):
+            name = stats.name.decode().replace('/', '.')
+            lines.append(f'{num:>4}: {stats.live_instances:>13} {stats.live_bytes:>14}  {name}')
+        lines.append(f'Total {sum(s.live_instances for s in live):>13} {self.live_bytes:>14}')
+        return '\n'.join(lines)
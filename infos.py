@@ -1,16 +1,19 @@
-from contextlib import suppress
+from array import array
+from contextlib import nullcontext, suppress
 from dataclasses import dataclass, field
 from collections import deque
-from functools import cached_property
 from io import BytesIO
 from pprint import PrettyPrinter
-from typing import Any, Optional, Type
+from typing import Any, Awaitable, Callable, ContextManager, Generator, Optional, Type, TYPE_CHECKING
 from inspect import Signature
 
 from enums import *
 from utils import *
+from bytecode import Instruction, branch_targets, decode, fuse, link_branches
 
-loaded_classes: dict[bytes, 'ClassFile'] = {}
+if TYPE_CHECKING:
+    from vm import VM, ClassLoader
+    from heap import ClassStats
 
 
 class ConstantPoolInfo:
@@ -53,6 +56,75 @@ class Nothing(ConstantPoolInfo):
     pass
 
 
+class ConstantPool:
+    """
+    Constant pool of a parsed class, stored column wise instead of as one
+    object per entry. Entries are only built when they are looked up, utf8
+    entries stay offsets into the class file until then.
+    """
+    __slots__ = ('data', 'tags', 'first', 'second', 'integers', 'floats')
+
+    def __init__(self, data: bytes = b''):
+        self.data = data
+        self.tags = bytearray()
+        # class, name or string index; utf8 offset; index into integers or floats
+        self.first = array('I')
+        # name and type or descriptor index; utf8 length
+        self.second = array('H')
+        self.integers = array('q')
+        self.floats = array('d')
+
+    def append(self, tag: CPInfoTag, first: int = 0, second: int = 0):
+        self.tags.append(tag.value)
+        self.first.append(first)
+        self.second.append(second)
+
+    def append_integer(self, tag: CPInfoTag, value: int):
+        self.append(tag, len(self.integers))
+        self.integers.append(value)
+
+    def append_float(self, tag: CPInfoTag, value: float):
+        self.append(tag, len(self.floats))
+        self.floats.append(value)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, idx: int) -> ConstantPoolInfo:
+        # entries are built again on every lookup instead of being kept around,
+        # the interpreter keeps what it resolved in its instructions instead
+        return self.build(idx)
+
+    def __iter__(self):
+        return (self.build(i) for i in range(len(self)))
+
+    def build(self, idx: int) -> ConstantPoolInfo:
+        first, second = self.first[idx], self.second[idx]
+        match self.tags[idx]:
+            case CPInfoTag.Utf8.value:
+                return Utf8Info(self.data[first:first + second])
+            case CPInfoTag.Methodref.value | CPInfoTag.Fieldref.value | CPInfoTag.InterfaceMethodref.value:
+                return ReferenceInfo(first, second)
+            case CPInfoTag.Class.value:
+                return ClassInfo(first)
+            case CPInfoTag.NameAndType.value:
+                return NameAndTypeInfo(first, second)
+            case CPInfoTag.String.value:
+                return StringInfo(first)
+            case CPInfoTag.Integer.value:
+                return IntegerInfo(self.integers[first])
+            case CPInfoTag.Long.value:
+                return LongInfo(self.integers[first])
+            case CPInfoTag.Float.value:
+                return FloatInfo(self.floats[first])
+            case CPInfoTag.Double.value:
+                return DoubleInfo(self.floats[first])
+            case CPInfoTag.Nothing.value:
+                return Nothing()
+            case tag:
+                raise ValueError(f'unexpected tag {CPInfoTag(tag)}')
+
+
 @dataclass(slots=True)
 class HasAttributes:
     attributes: list["AttributeInfo"] = field(default_factory=list)
@@ -93,6 +165,20 @@ class CodeAttribute(AttributeInfo, HasAttributes):
     max_locals: int = 0
     code: bytes = b''
     exception_table: list[ExceptionDescriptor] = field(default_factory=list)
+    # filled in on the first call, see MethodInfo.instructions
+    instructions: Optional[list[Instruction]] = field(default=None, repr=False, compare=False)
+
+    def decode(self) -> list[Instruction]:
+        from arithmetic import HANDLERS, fused
+        instructions = decode(self.code)
+        targets = branch_targets(instructions) | {e.handler_pc for e in self.exception_table}
+        instructions = link_branches(fuse(instructions, targets))
+        for instruction in instructions:
+            if instruction.opcode == Superinstruction.fused:
+                instruction.handler = fused(instruction.parts)
+            else:
+                instruction.handler = HANDLERS.get(instruction.opcode)
+        return instructions
 
 
 @dataclass
@@ -107,6 +193,13 @@ class SourceFile(AttributeInfo):
     source: bytes
 
 
+@dataclass
+class StackMapTable(AttributeInfo):
+    __attr_name__ = AttributeName.StackMapTable
+    # only needed for verification, so it is kept undecoded
+    data: bytes
+
+
 class SignatureAttr(AttributeInfo):
     def __init__(self, sig: bytes):
         self.descriptor = sig
@@ -115,7 +208,7 @@ class SignatureAttr(AttributeInfo):
 @dataclass
 class StackEntry:
     tag: StackTag
-    data: object
+    data: Any
     @classmethod
     def from_value(cls, value):
         if isinstance(value, int):
@@ -134,6 +227,10 @@ class FieldInfo(HasAttributes):
     descriptor_index: int = 0
 
 
+# what running a method produces, see MethodInfo.execute
+Frame = Generator[Optional[Awaitable], Any, None]
+
+
 @dataclass(slots=True, repr=False)
 class MethodInfo(HasAttributes):
     klass: Optional["ClassFile"] = None
@@ -142,6 +239,8 @@ class MethodInfo(HasAttributes):
     descriptor_index: int = 0
 
     signature: Optional[tuple[tuple[bytes, ...], bytes]] = None
+    # where the second local slot of long and double arguments goes
+    padding: tuple[int, ...] = ()
 
     def __post_init__(self):
         # print(self.klass)
@@ -149,165 +248,290 @@ class MethodInfo(HasAttributes):
         descriptor = self.klass.get_const(self.descriptor_index, Utf8Info).bytes
         args: list[bytes] = []
         ret = b'V'
+        # next free local slot, the receiver takes the first one
+        slot = 0 if Access.STATIC in self.access_flags else 1
+        padding = []
         with BytesIO(descriptor) as d:
             assert d.read(1) == b'('
             while d.tell() < len(descriptor):
                 match d.read(1):
+                    case b'[':
+                        # arrays are a single reference, whatever their element type
+                        array = b'['
+                        while (b := d.read(1)) == b'[':
+                            array += b
+                        args.append(array + (b + read_until(d, b';') + b';' if b == b'L' else b))
+                        slot += 1
                     case b'L':
                         args.append(read_until(d, b';'))
-                    case  (b'B' | b'C' | b'D' | b'F' | b'I' | b'J' | b'S' | b'Z') as b:
+                        slot += 1
+                    case (b'D' | b'J') as b:
+                        args.append(b)
+                        padding.append(slot + 1)
+                        slot += 2
+                    case  (b'B' | b'C' | b'F' | b'I' | b'S' | b'Z') as b:
                         args.append(b)
+                        slot += 1
                     case b')':
                         ret = d.read()
         self.signature = (tuple(args), ret)
-
-    def run(self, cls: "ClassFile", stack: deque[StackEntry], locals: list):
+        self.padding = tuple(padding)
+
+    def execute(self, vm: "VM", stack: deque[StackEntry], locals: list) -> "Frame":
+        """
+        Generator running this method. It yields None whenever the VM's
+        instruction budget is used up and the awaitables returned by async
+        natives, which the driver has to send the result of back in.
+        """
+        cls = self.klass
         code = self.attribute_by_name(AttributeName.Code)
-        assert isinstance(code, CodeAttribute)
+        assert isinstance(code, CodeAttribute) and cls
+        for index in self.padding:
+            locals.insert(index, None)
         locals.extend([None] * (code.max_locals - len(locals)))
-        bytecode = code.code
-        offset = 0
-        with BytesIO(bytecode) as instructions:
-            while instructions.tell() < len(bytecode):
-                opcode = Opcode(instructions.read(1)[0])
-                # print(opcode, locals)
-                match opcode:
-                    case Opcode.getstatic:
-                        index = parse_cp_index(instructions)
-                        class_name, attr_name, attr_type = cls.get_class_name_and_type(index)
-                        class_file = loaded_classes[class_name]
-                        # print(class_name, attr_name, attr_type)
-                        class_file.initialize()
-                        value = class_file.get_static_field(attr_name)
-                        stack.append(StackEntry.from_value(value))
-                        offset += 1
-                    case Opcode.ldc:
-                        index = parse_int(instructions, 1) - 1
-                        const: ConstantPoolInfo = cls.constant_pool[index]
-                        data: int | float | str
-                        match const:
-                            case StringInfo(v):
-                                data = cls.get_const(v, Utf8Info).bytes.decode('utf-8')
-                            case IntegerInfo(v) | LongInfo(v) | FloatInfo(v) | DoubleInfo(v):
-                                data = v
-                            case tag:
-                                raise TypeError(f'cannot push constant of type {tag}')
-                        stack.append(StackEntry.from_value(data))
-                        offset += 1
-                    case Opcode.invokevirtual:
-                        index = parse_cp_index(instructions)
-                        class_name, method_name, method_type = cls.get_class_name_and_type(index)
-                        class_file = loaded_classes[class_name]
-                        # print(class_name, method_name, method_type)
-                        method = class_file.resolve_overload(method_name, method_type)
-                        assert method.signature
-                        args: list = []
-                        for spot in method.signature[0]:
-                            args.append(stack.pop())
-                            offset -= 1
-                        args.append(stack.pop())
-                        offset -= 1
-                        args.reverse()
-                        method.run(cls, stack, args)
-                    case Opcode.new:
-                        index = parse_cp_index(instructions)
-                        clazz = cls.get_const(index, ClassInfo)
-                        name_info = cls.get_const(clazz.name_index, Utf8Info)
-                        class_name = name_info.bytes
-                        actual = loaded_classes[class_name]
-                        stack.append(StackEntry(StackTag.Reference, actual.new_instance()))
-                        offset += 1
-                    case Opcode.putfield:
-                        index = parse_cp_index(instructions)
-                        class_name, attr_name, attr_type = cls.get_class_name_and_type(index)
-                        # print(class_name, attr_name, attr_type)
-                        value = stack.pop()
-                        offset -= 1
-                        ref = stack.pop()
-                        offset -= 1
-                        assert ref.tag == StackTag.Reference
-                        if ref.data is None:
-                            raise ValueError(f'attempting to set {attr_name!r} on None')
-                        assert isinstance(ref.data, Instance)
-                        ref.data.fields[attr_name] = value
-                    case Opcode.getfield:
-                        index = parse_cp_index(instructions)
-                        class_name, attr_name, attr_type = cls.get_class_name_and_type(index)
-                        # print(class_name, attr_name, attr_type)
-                        ref = stack.pop()
-                        # print(ref)
-                        assert ref.tag == StackTag.Reference and isinstance(ref.data, Instance)
-                        stack.append(ref.data.get_field(attr_name))
-                    case Opcode.invokespecial:
-                        index = parse_cp_index(instructions)
-                        class_name, method_name, method_type = cls.get_class_name_and_type(index)
-                        klass = loaded_classes[class_name]
-                        # print(class_name, method_name, method_type)
-                        method = klass.resolve_overload(method_name, method_type)
-                        assert method.signature
-                        args = []
-                        for spot in method.signature[0]:
-                            args.append(stack.pop())
-                            offset -= 1
-                        if Access.STATIC not in method.access_flags:
-                            args.append(stack.pop())
-                            offset -= 1
-                        method.run(cls, stack, args)
-                    case Opcode.ldc2_w:
-                        index = parse_cp_index(instructions)
-                        const = cls.get_const(index, ConstantPoolInfo)
-                        # assert isinstance(const, DoubleInfo | LongInfo)
-                        # stack.append(StackEntry(const.value))
-                        match const:
-                            case DoubleInfo(x):
-                                stack.append(StackEntry(StackTag.Float, x))
-                            case LongInfo(x):
-                                stack.append(StackEntry(StackTag.Integer, x))
-                            case x:
-                                raise ValueError(f'invalid operand for {opcode}: {x}')
-                        offset += 1
-                    case Opcode.aload_0:
-                        stack.append(locals[0])
-                        offset += 1
-                    case Opcode.aload_1:
-                        stack.append(locals[1])
-                        offset += 1
-                    case Opcode.astore_1:
-                        locals[1] = stack.pop()
-                        offset -= 1
-                    case Opcode.sipush:
-                        stack.append(StackEntry.from_value(parse_int(instructions, 2)))
-                        offset += 1
-                    case Opcode.bipush:
-                        stack.append(StackEntry.from_value(instructions.read(1)[0]))
-                        offset += 1
-                    case Opcode.dup:
-                        stack.append(stack[-1])
-                        offset += 1
-                    case Opcode.iconst_1:
-                        stack.append(StackEntry(StackTag.Integer, 1))
-                        offset += 1
-                    case Opcode.dconst_1:
-                        stack.append(StackEntry(StackTag.Float, 1.0))
-                        offset += 1
-                    case Opcode.return_:
-                        return
-                    case Opcode.areturn:
-                        ret = stack.pop()
-                        offset -= 1
-                        while offset:
-                            stack.pop()
-                            offset -= 1
-                        stack.append(ret)
-                    case i:
-                        raise ValueError(f'unexpected Opcode: {i} ({hex(i.value)})')
-                # print(stack)
+        # the stack is shared with the caller, everything above this is ours
+        base = len(stack)
+        instructions = code.instructions or self.instructions()
+        ip = 0
+        while True:
+            instruction = instructions[ip]
+            ip += 1
+            vm.fuel -= 1
+            if vm.fuel <= 0:
+                vm.fuel = vm.instruction_budget
+                yield None
+            if (handler := instruction.handler) is not None:
+                handler(stack, locals, instruction.operands)
+                continue
+            opcode = instruction.opcode
+            # print(opcode, locals)
+            match opcode:
+                case Opcode.goto:
+                    ip = instruction.operands[0]
+                case Opcode.if_icmplt:
+                    b = stack.pop().data
+                    if stack.pop().data < b:
+                        ip = instruction.operands[0]
+                case Opcode.if_icmpge:
+                    b = stack.pop().data
+                    if stack.pop().data >= b:
+                        ip = instruction.operands[0]
+                case Opcode.if_icmpgt:
+                    b = stack.pop().data
+                    if stack.pop().data > b:
+                        ip = instruction.operands[0]
+                case Opcode.if_icmple:
+                    b = stack.pop().data
+                    if stack.pop().data <= b:
+                        ip = instruction.operands[0]
+                case Opcode.if_icmpeq:
+                    b = stack.pop().data
+                    if stack.pop().data == b:
+                        ip = instruction.operands[0]
+                case Opcode.if_icmpne:
+                    b = stack.pop().data
+                    if stack.pop().data != b:
+                        ip = instruction.operands[0]
+                case Opcode.ifeq:
+                    if stack.pop().data == 0:
+                        ip = instruction.operands[0]
+                case Opcode.ifne:
+                    if stack.pop().data != 0:
+                        ip = instruction.operands[0]
+                case Opcode.iflt:
+                    if stack.pop().data < 0:
+                        ip = instruction.operands[0]
+                case Opcode.ifge:
+                    if stack.pop().data >= 0:
+                        ip = instruction.operands[0]
+                case Opcode.ifgt:
+                    if stack.pop().data > 0:
+                        ip = instruction.operands[0]
+                case Opcode.ifle:
+                    if stack.pop().data <= 0:
+                        ip = instruction.operands[0]
+                case Opcode.ireturn | Opcode.lreturn | Opcode.freturn | Opcode.dreturn | Opcode.areturn:
+                    ret = stack.pop()
+                    while len(stack) > base:
+                        stack.pop()
+                    stack.append(ret)
+                    return
+                case Opcode.return_:
+                    while len(stack) > base:
+                        stack.pop()
+                    return
+                case Opcode.getstatic:
+                    if (static := instruction.cache) is None:
+                        static = cls.fill_cache(instruction, lambda: cls.resolve_field(*instruction.operands))
+                    stack.append(StackEntry.from_value(vm.get_static(*static)))
+                case Opcode.ldc | Opcode.ldc_w | Opcode.ldc2_w:
+                    # entries are never changed in place, so every run can push the same one
+                    if (constant := instruction.cache) is None:
+                        constant = cls.fill_cache(instruction, lambda: cls.load_constant(*instruction.operands))
+                    stack.append(constant)
+                case Opcode.invokevirtual:
+                    site = instruction.cache
+                    if site is None:
+                        with cls.lock:
+                            # another thread may have filled it while this one waited
+                            if (site := instruction.cache) is None:
+                                site = instruction.cache = CallSite(cls, *instruction.operands)
+                                site.target(stack[-site.arg_count - 1].data)
+                                site.inline_into(instruction)
+                    method = site.target(stack[-site.arg_count - 1].data)
+                    yield from self.invoke(vm, stack, method)
+                case Opcode.invokestatic:
+                    if (method := instruction.cache) is None:
+                        method = cls.fill_cache(instruction, lambda: cls.resolve_method(*instruction.operands))
+                    assert method.klass
+                    vm.initialize(method.klass)
+                    yield from self.invoke(vm, stack, method)
+                case Opcode.new:
+                    if (actual := instruction.cache) is None:
+                        actual = cls.fill_cache(instruction, lambda: cls.resolve_class(*instruction.operands))
+                    stack.append(StackEntry(StackTag.Reference, vm.new_instance(actual)))
+                case Opcode.putfield:
+                    if (attr_name := instruction.cache) is None:
+                        attr_name = cls.fill_cache(instruction, lambda: cls.get_class_name_and_type(*instruction.operands)[1])
+                    value = stack.pop()
+                    ref = stack.pop()
+                    assert ref.tag == StackTag.Reference
+                    if ref.data is None:
+                        raise ValueError(f'attempting to set {attr_name!r} on None')
+                    assert isinstance(ref.data, Instance)
+                    ref.data.fields[attr_name] = value
+                case Opcode.getfield:
+                    if (attr_name := instruction.cache) is None:
+                        attr_name = cls.fill_cache(instruction, lambda: cls.get_class_name_and_type(*instruction.operands)[1])
+                    ref = stack.pop()
+                    # print(ref)
+                    assert ref.tag == StackTag.Reference and isinstance(ref.data, Instance)
+                    stack.append(ref.data.get_field(attr_name))
+                case Opcode.invokespecial:
+                    if (method := instruction.cache) is None:
+                        method = cls.fill_cache(instruction, lambda: cls.resolve_method(*instruction.operands))
+                    yield from self.invoke(vm, stack, method)
+                case Superinstruction.aload_0_getfield:
+                    if (attr_name := instruction.cache) is None:
+                        attr_name = cls.fill_cache(instruction, lambda: cls.get_class_name_and_type(*instruction.operands)[1])
+                    ref = locals[0]
+                    assert ref.tag == StackTag.Reference and isinstance(ref.data, Instance)
+                    stack.append(ref.data.get_field(attr_name))
+                case Superinstruction.aload_0_load_1_putfield:
+                    if (attr_name := instruction.cache) is None:
+                        attr_name = cls.fill_cache(instruction, lambda: cls.get_class_name_and_type(*instruction.operands)[1])
+                    ref = locals[0]
+                    assert ref.tag == StackTag.Reference
+                    if ref.data is None:
+                        raise ValueError(f'attempting to set {attr_name!r} on None')
+                    assert isinstance(ref.data, Instance)
+                    ref.data.fields[attr_name] = locals[1]
+                case Superinstruction.new_dup_invokespecial:
+                    if (resolved := instruction.cache) is None:
+                        class_index, method_index = instruction.operands
+                        resolved = cls.fill_cache(instruction, lambda: (cls.resolve_class(class_index), cls.resolve_method(method_index)))
+                    actual, method = resolved
+                    ref = StackEntry(StackTag.Reference, vm.new_instance(actual))
+                    stack.append(ref)
+                    assert method.signature
+                    if method.signature[0]:
+                        # not a plain constructor call, the copy is an argument
+                        stack.append(ref)
+                        yield from self.invoke(vm, stack, method)
+                    else:
+                        yield from method.execute(vm, stack, [ref])
+                case Superinstruction.getstatic_ldc_invokevirtual:
+                    if (resolved := instruction.cache) is None:
+                        field_index, const_index, method_index = instruction.operands
+                        resolved = cls.fill_cache(instruction, lambda: (
+                            cls.resolve_field(field_index), cls.load_constant(const_index), CallSite(cls, method_index)))
+                    static, value, site = resolved
+                    receiver = StackEntry.from_value(vm.get_static(*static))
+                    if site.arg_count == 1:
+                        method = site.target(receiver.data)
+                        yield from method.execute(vm, stack, [receiver, value])
+                    else:
+                        stack.append(receiver)
+                        stack.append(value)
+                        method = site.target(stack[-site.arg_count - 1].data)
+                        yield from self.invoke(vm, stack, method)
+                case Superinstruction.inlined_return_argument:
+                    site = instruction.cache
+                    receiver = stack[-site.arg_count - 1].data
+                    if isinstance(receiver, Instance) and receiver.klass is site.guard:
+                        args = [stack.pop() for _ in range(site.arg_count + 1)]
+                        stack.append(args[site.arg_count - site.inlined])
+                    else:
+                        yield from self.invoke(vm, stack, site.target(receiver))
+                case Superinstruction.inlined_getter:
+                    site = instruction.cache
+                    receiver = stack[-1].data
+                    if isinstance(receiver, Instance) and receiver.klass is site.guard:
+                        stack[-1] = receiver.get_field(site.inlined)
+                    else:
+                        yield from self.invoke(vm, stack, site.target(receiver))
+                case Superinstruction.inlined_setter:
+                    site = instruction.cache
+                    receiver = stack[-2].data
+                    if isinstance(receiver, Instance) and receiver.klass is site.guard:
+                        receiver.fields[site.inlined] = stack.pop()
+                        stack.pop()
+                    else:
+                        yield from self.invoke(vm, stack, site.target(receiver))
+                case i:
+                    raise ValueError(f'unexpected Opcode: {i} ({hex(i.value)})')
+            # print(stack)
+
+    def instructions(self) -> list[Instruction]:
+        """the decoded code of this method, decoding it on the first call"""
+        code = self.attribute_by_name(AttributeName.Code)
+        assert isinstance(code, CodeAttribute) and self.klass
+        if code.instructions is None:
+            with self.klass.lock:
+                if code.instructions is None:
+                    code.instructions = code.decode()
+        return code.instructions
+
+    def invoke(self, vm: "VM", stack: deque[StackEntry], method: "MethodInfo") -> Frame:
+        """pop the arguments of `method` (including the receiver) and run it"""
+        assert method.signature
+        count = len(method.signature[0])
+        if Access.STATIC not in method.access_flags:
+            count += 1
+        args = [stack.pop() for _ in range(count)]
+        args.reverse()
+        yield from method.execute(vm, stack, args)
+
+    def trivial_body(self) -> Optional[tuple[Superinstruction, int | bytes]]:
+        """if this method only returns an argument or gets/sets a field, how to inline it and with what"""
+        if not self.has_attribute(AttributeName.Code):
+            return None
+        assert self.klass and self.signature
+        # the inlined bodies find the receiver right below the arguments they expect
+        arg_count = len(self.signature[0])
+        match [(i.opcode, i.operands) for i in self.instructions()]:
+            case [(Opcode.aload_0, _), (Opcode.areturn, _)]:
+                return Superinstruction.inlined_return_argument, 0
+            case [(Opcode.aload_1 | Opcode.iload_1 | Opcode.lload_1 | Opcode.fload_1 | Opcode.dload_1, _),
+                  (Opcode.areturn | Opcode.ireturn | Opcode.lreturn | Opcode.freturn | Opcode.dreturn, _)]:
+                return Superinstruction.inlined_return_argument, 1
+            case [(Superinstruction.aload_0_getfield, [index]),
+                  (Opcode.areturn | Opcode.ireturn | Opcode.lreturn | Opcode.freturn | Opcode.dreturn, _)] if arg_count == 0:
+                return Superinstruction.inlined_getter, self.klass.get_class_name_and_type(index)[1]
+            case [(Superinstruction.aload_0_load_1_putfield, [index]), (Opcode.return_, _)] if arg_count == 1:
+                return Superinstruction.inlined_setter, self.klass.get_class_name_and_type(index)[1]
+        return None
 
 
 @dataclass(repr=False)
 class Instance:
     klass: "ClassFile"
     fields: dict[bytes, Any] = field(default_factory=dict)
+    # accounting of the heap this was allocated on, if any
+    stats: Optional["ClassStats"] = field(default=None, compare=False)
+    def __del__(self):
+        if self.stats is not None:
+            self.stats.heap.free(self.stats)
     def get_field(self, name: bytes):
         if name in self.fields:
             return self.fields[name]
@@ -316,25 +540,73 @@ class Instance:
         return f'{self.klass.class_name}({self.fields})'
 
 
+# distinct receiver classes a call site remembers before going megamorphic
+POLYMORPHIC_LIMIT = 4
+
+
+class CallSite:
+    """inline cache of a single invokevirtual instruction"""
+    __slots__ = ('owner', 'static_class', 'name', 'descriptor', 'arg_count', 'entries', 'megamorphic', 'guard', 'inlined')
+
+    def __init__(self, cls: "ClassFile", index: int):
+        # the class whose code this call site is in, its loader guards the entries
+        self.owner = cls
+        class_name, self.name, self.descriptor = cls.get_class_name_and_type(index)
+        self.static_class = cls.class_by_name(class_name)
+        method = self.static_class.lookup_method(self.name, self.descriptor)
+        assert method.signature
+        self.arg_count = len(method.signature[0])
+        self.entries: list[tuple[ClassFile, MethodInfo]] = []
+        self.megamorphic = False
+        self.guard: Optional[ClassFile] = None
+        self.inlined: int | bytes = 0
+
+    def target(self, receiver) -> MethodInfo:
+        # natives are plain python objects, they can only be of the static class
+        klass = receiver.klass if isinstance(receiver, Instance) else self.static_class
+        if self.megamorphic:
+            return klass.lookup_method(self.name, self.descriptor)
+        for k, method in self.entries:
+            if k is klass:
+                return method
+        method = klass.lookup_method(self.name, self.descriptor)
+        with self.owner.lock:
+            if len(self.entries) < POLYMORPHIC_LIMIT:
+                self.entries.append((klass, method))
+            else:
+                self.megamorphic = True
+                self.entries.clear()
+        return method
+
+    def inline_into(self, instruction: Instruction):
+        """replace `instruction` by the body of the target if it is trivial, guarded by the receiver class"""
+        if len(self.entries) != 1:
+            return
+        klass, method = self.entries[0]
+        if (trivial := method.trivial_body()) is not None:
+            instruction.opcode, self.inlined = trivial
+            self.guard = klass
+
+
 @dataclass(slots=True)
 class ClassFile(HasAttributes):
     minor_version: int = 0
     major_version: int = 0
-    constant_pool: list[ConstantPoolInfo] = field(default_factory=list)
+    constant_pool: list[ConstantPoolInfo] | ConstantPool = field(default_factory=list)
     access_flags: Access = Access.PUBLIC
     this_class: int = 0
     super_class: int = 0
     interfaces: list[int] = field(default_factory=list)
     fields: list[FieldInfo] = field(default_factory=list)
     methods: list[MethodInfo] = field(default_factory=list)
-    initialized: InitializationState = InitializationState.verified
+    # initial values of the static fields, every VM starts off with its own copy
     static_fields: dict = field(default_factory=dict)
+    loader: Optional["ClassLoader"] = field(default=None, repr=False, compare=False)
+    method_cache: dict[tuple[bytes, bytes], MethodInfo] = field(default_factory=dict, repr=False, compare=False)
 
-    def get_static_field(self, name: bytes):
-        if name in self.static_fields:
-            return self.static_fields[name]
-        else:
-            raise AttributeError(f'{self.class_name}.{name.decode()}')
+    def class_by_name(self, name: bytes) -> "ClassFile":
+        assert self.loader, f'{self.class_name!r} cannot load other classes'
+        return self.loader.load(name)
 
     def methods_by_name(self, name: bytes) -> list[MethodInfo]:
         return [mi for mi in self.methods if isinstance(c := self.constant_pool[mi.name_index], Utf8Info) and c.bytes == name]
@@ -360,6 +632,38 @@ class ClassFile(HasAttributes):
             raise ValueError(f'Ambiguous overload for {name!r} with signature {signature!r}')
         return fit[0]
 
+    def lookup_method(self, name: bytes, signature: bytes) -> MethodInfo:
+        """find the method a virtual call on an instance of this class runs"""
+        key = (name, signature)
+        if key in self.method_cache:
+            return self.method_cache[key]
+        klass: Optional[ClassFile] = self
+        while klass is not None:
+            # like the jvm the whole descriptor has to match, return type included,
+            # otherwise covariant overrides and their bridge methods are ambiguous
+            for method in klass.methods_by_name(name):
+                if klass.get_const(method.descriptor_index, Utf8Info).bytes == signature:
+                    with self.lock:
+                        self.method_cache[key] = method
+                    return method
+            klass = klass.superclass
+        raise ValueError(f'No method {name!r} with signature {signature!r} in {self.class_name!r}')
+
+    @property
+    def lock(self) -> ContextManager:
+        """
+        held while running code fills in the caches of this class, the built in
+        classes have no loader, but they are never part of a snapshot either
+        """
+        return self.loader.lock if self.loader is not None else nullcontext()
+
+    @property
+    def superclass(self) -> Optional["ClassFile"]:
+        sup = self.constant_pool[self.super_class]
+        if not isinstance(sup, ClassInfo):
+            return None
+        return self.class_by_name(self.get_const(sup.name_index, Utf8Info).bytes)
+
     def get_class_name_and_type(self, index: int) -> tuple[bytes, bytes, bytes]:
         attr = self.get_const(index, ReferenceInfo)
         clazz = self.get_const(attr.class_index, ClassInfo)
@@ -370,6 +674,41 @@ class ClassFile(HasAttributes):
         attr_type = self.get_const(attr_name_and_type.descriptor_index, Utf8Info).bytes
         return class_name, attr_name, attr_type
 
+    def resolve_class(self, index: int) -> "ClassFile":
+        clazz = self.get_const(index, ClassInfo)
+        return self.class_by_name(self.get_const(clazz.name_index, Utf8Info).bytes)
+
+    def resolve_method(self, index: int) -> MethodInfo:
+        class_name, method_name, method_type = self.get_class_name_and_type(index)
+        # print(class_name, method_name, method_type)
+        return self.class_by_name(class_name).resolve_overload(method_name, method_type)
+
+    def resolve_field(self, index: int) -> tuple["ClassFile", bytes]:
+        class_name, attr_name, attr_type = self.get_class_name_and_type(index)
+        return self.class_by_name(class_name), attr_name
+
+    def fill_cache(self, instruction: Instruction, resolve: Callable[[], T]) -> T:
+        """resolve what `instruction` refers to on its first run, later runs find it in its cache"""
+        with self.lock:
+            if instruction.cache is None:
+                instruction.cache = resolve()
+            return instruction.cache
+
+    def load_constant(self, index: int) -> StackEntry:
+        match self.constant_pool[index]:
+            case StringInfo(v):
+                return StackEntry(StackTag.Reference, self.get_const(v, Utf8Info).bytes.decode('utf-8'))
+            case IntegerInfo(v):
+                return StackEntry(StackTag.Integer, v)
+            case LongInfo(v):
+                return StackEntry(StackTag.Long, v)
+            case FloatInfo(v):
+                return StackEntry(StackTag.Float, v)
+            case DoubleInfo(v):
+                return StackEntry(StackTag.Double, v)
+            case tag:
+                raise TypeError(f'cannot push constant of type {tag}')
+
     def validate(self, pp: PrettyPrinter):
         for const in self.constant_pool:
             # with suppress(AttributeError):
@@ -397,35 +736,6 @@ class ClassFile(HasAttributes):
                     res.fields[name] = None
         return res
 
-    def initialize(self, pp: PrettyPrinter=None):
-        if pp is None:
-            pp = PrettyPrinter()
-        from jvm import parse_class
-        match self.initialized:
-            case InitializationState.in_progress | InitializationState.done:
-                return
-            case InitializationState.error:
-                raise ValueError(f'NoClassDefFoundError: {self.constant_pool[self.this_class]}')
-        self.initialized = InitializationState.in_progress
-        if Access.INTERFACE not in self.access_flags:
-            sup = self.constant_pool[self.super_class]
-            assert isinstance(sup, ClassInfo)
-            name: bytes = self.get_const(sup.name_index, Utf8Info).bytes
-            if name not in loaded_classes:
-                try:
-                    superclass = parse_class(name.decode())
-                    superclass.validate(pp)
-                except Exception:
-                    self.initialized = InitializationState.error
-                    raise
-            else:
-                superclass = loaded_classes[name]
-            if superclass.initialized != InitializationState.done:
-                superclass.initialize(pp)
-            # [init] = self.methods_by_name(b'<init>')
-            # init.run(self, deque())
-            # self.initialized = InitializationState.done
-
     @property
     def class_name(self):
         return self.get_const(self.get_const(self.this_class, ClassInfo).name_index, Utf8Info).bytes
@@ -1,3 +1,4 @@
+from io import BytesIO
 from typing import BinaryIO, Final
 from pprint import PrettyPrinter
 
@@ -5,31 +6,27 @@ from enums import *
 from infos import *
 from utils import *
 
-from faking_it import fake_classes
-
-loaded_classes |= fake_classes
-
 
 def parse_class(path: str):
     clazz = ClassFile()
-    with open(path, 'rb') as f:
+    with open(path, 'rb') as raw:
+        data = raw.read()
+    with BytesIO(data) as f:
         magic = parse_int(f, 4)
         assert magic == 0xCAFEBABE
         clazz.minor_version = parse_int(f, 2)
         clazz.major_version = parse_int(f, 2)
         constant_count = parse_cp_index(f)
-        clazz.constant_pool = []
+        clazz.constant_pool = pool = ConstantPool(data)
         was_two = False
         for _ in range(constant_count):
             if was_two:
                 was_two = False
                 continue
-            e = parse_constant_pool_info(f)
-            if not isinstance(e, Nothing):
-                clazz.constant_pool.append(e)
-            if isinstance(e, (DoubleInfo, LongInfo)):
+            tag = parse_constant_pool_info(f, pool)
+            if tag in (CPInfoTag.Double, CPInfoTag.Long):
                 was_two = True
-                clazz.constant_pool.append(Nothing())
+                pool.append(CPInfoTag.Nothing)
         clazz.access_flags = Access(parse_int(f, 2))
         clazz.this_class = parse_cp_index(f)
         clazz.super_class = parse_cp_index(f)
@@ -41,54 +38,50 @@ def parse_class(path: str):
         clazz.methods = [parse_method_info(f, clazz) for _ in range(method_count)]
         attrs_count = parse_int(f, 2)
         clazz.attributes = [parse_attribute_info(f, clazz) for _ in range(attrs_count)]
-    obj = clazz.get_const(clazz.this_class, ClassInfo)
     # TODO: clazz.resolve_indices()
-    name_info = clazz.get_const(obj.name_index, Utf8Info)
-    loaded_classes[name_info.bytes] = clazz
     return clazz
 
 
-def parse_constant_pool_info(f: BinaryIO) -> ConstantPoolInfo:
+def parse_constant_pool_info(f: BinaryIO, pool: ConstantPool) -> CPInfoTag:
     tag = CPInfoTag(parse_int(f, 1))
     match tag:
         case CPInfoTag.Methodref | CPInfoTag.Fieldref | CPInfoTag.InterfaceMethodref:
-            return ReferenceInfo(parse_cp_index(f), parse_cp_index(f))
+            pool.append(tag, parse_cp_index(f), parse_cp_index(f))
         case CPInfoTag.Class:
-            return ClassInfo(parse_cp_index(f))
+            pool.append(tag, parse_cp_index(f))
         case CPInfoTag.NameAndType:
-            return NameAndTypeInfo(parse_cp_index(f), parse_cp_index(f))
+            pool.append(tag, parse_cp_index(f), parse_cp_index(f))
         case CPInfoTag.Utf8:
             length = parse_int(f, 2)
-            return Utf8Info(f.read(length))
+            pool.append(tag, f.tell(), length)
+            f.seek(length, 1)
         case CPInfoTag.String:
-            return StringInfo(parse_cp_index(f))
+            pool.append(tag, parse_cp_index(f))
         case CPInfoTag.Integer:
-            return IntegerInfo(parse_int(f, 4))
+            pool.append_integer(tag, parse_signed(f, 4))
         case CPInfoTag.Long:
-            return LongInfo(parse_int(f, 8))
+            pool.append_integer(tag, parse_signed(f, 8))
         case CPInfoTag.Float:
             bits = parse_int(f, 4)
             s = -1 if  bits >> 31 else 1
             e = ((bits >> 23) & 0xff)
             if e != 0xff:
                 m = (bits & 0x7fffff) | 0x800000 if e else (bits & 0x7fffff) << 1
-                return FloatInfo(s * m * 2 ** (e - 150))
+                pool.append_float(tag, s * m * 2 ** (e - 150))
             else:
-                return FloatInfo(s * float('inf'))
+                pool.append_float(tag, s * float('inf'))
         case CPInfoTag.Double:
             bits = parse_int(f, 8)
             s = -1 if bits >> 63 else 1
             e = (bits >> 52) & 0x7ff
             if e != 0x7ff:
                 m = (bits & 0xfffffffffffff) | 0x10000000000000 if e else (bits & 0xfffffffffffff) << 1
-                return DoubleInfo(s * m * 2 ** (e - 1075))
+                pool.append_float(tag, s * m * 2 ** (e - 1075))
             else:
-                return DoubleInfo(s * float('inf'))
-        case CPInfoTag.Nothing:
-            pass
+                pool.append_float(tag, s * float('inf'))
         case _:
             raise ValueError(f'unexpected tag {tag}')
-    raise TypeError(f'this cannot happen')
+    return tag
 
 
 def parse_field_info(f: BinaryIO, klass: ClassFile) -> FieldInfo:
@@ -147,22 +140,12 @@ def parse_attribute_info(f: BinaryIO, clazz: ClassFile) -> AttributeInfo:
         case AttributeName.Signature:
             assert length == 2
             return SignatureAttr(clazz.get_const(parse_cp_index(f), Utf8Info).bytes)
+        case AttributeName.StackMapTable:
+            return StackMapTable(f.read(length))
         case _:
             raise ValueError(f'unexpected attribute name {name}')
 
 
-# loaded_classes[b'java/lang/System'] = ClassFile()
-
-
 if __name__ == '__main__':
-    pp = PrettyPrinter()
-    c = parse_class('Thing.class')
-    c.validate(pp)
-    # print(c.constant_pool[c.methods_by_name(b'hmmm')[0].descriptor_index])
-    # pp.pprint(c.methods)
-    # for m in c.methods:
-    #     print()
-    c.initialize(pp)
-    # pp.pprint(c.methods_by_name(b'<init>'))
-    c.methods_by_name(b'main')[0].run(c, deque(), [[]])
-    # print(c.access_flags)
+    from vm import VM
+    VM().run_main(b'Thing')
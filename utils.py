@@ -6,6 +6,10 @@ def parse_int(f: BytesIO | BinaryIO, length: int) -> int:
     return int.from_bytes(f.read(length), 'big')
 
 
+def parse_signed(f: BytesIO | BinaryIO, length: int) -> int:
+    return int.from_bytes(f.read(length), 'big', signed=True)
+
+
 def parse_cp_index(f: BinaryIO):
     return parse_int(f, 2) - 1
 
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import pickle
+import sys
+import threading
+from collections import deque
+from pprint import PrettyPrinter
+from typing import Any, Awaitable, Iterable, TextIO
+
+from enums import Access, InitializationState, StackTag
+from infos import ClassFile, Frame, Instance, StackEntry, Utf8Info
+from faking_it import FakeClass, FakeMethod, StaticField, fake_classes
+from heap import Heap
+from jvm import parse_class
+
+
+class ClassLoader:
+    """
+    Finds, parses and caches class files by name.
+    Any number of VMs (also in different threads) can share a loader and its
+    classes. Running code does fill in parts of them though: the decoded
+    instructions, their inline caches and the method caches of the classes
+    are shared mutable state of every VM using the loader. Those fills and
+    the loading of classes happen under `lock`, which snapshots hold too.
+    """
+
+    def __init__(self, classpath: Iterable[str] = ('.',)):
+        self.classpath = list(classpath)
+        self.classes: dict[bytes, ClassFile] = dict(fake_classes)
+        # reentrant, filling a cache can load more classes
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def load(self, name: bytes) -> ClassFile:
+        if name in self.classes:
+            return self.classes[name]
+        with self.lock:
+            if name not in self.classes:
+                self.classes[name] = self.parse(name)
+            return self.classes[name]
+
+    def parse(self, name: bytes) -> ClassFile:
+        for entry in self.classpath:
+            path = os.path.join(entry, name.decode() + '.class')
+            if os.path.isfile(path):
+                clazz = parse_class(path)
+                clazz.loader = self
+                clazz.validate(PrettyPrinter())
+                if clazz.class_name != name:
+                    raise ValueError(f'NoClassDefFoundError: {name.decode()} (wrong name: {clazz.class_name.decode()})')
+                return clazz
+        raise ValueError(f'NoClassDefFoundError: {name.decode()}')
+
+
+class VM:
+    """
+    A single running Java program.
+    Holds everything a program can change: the static fields and
+    initialization state of its classes, its objects and its output.
+    """
+
+    def __init__(self, loader: ClassLoader | None = None, stdout: TextIO | None = None,
+                 instruction_budget: int = 10_000, max_heap: int | str | None = None):
+        self.loader = loader if loader is not None else ClassLoader()
+        self.stdout = stdout if stdout is not None else sys.stdout
+        self.heap = Heap(max_heap)
+        # instructions run before giving other tasks a turn in run_main_async
+        self.instruction_budget = instruction_budget
+        self.fuel = instruction_budget
+        self.statics: dict[bytes, dict[bytes, Any]] = {}
+        self.class_states: dict[bytes, InitializationState] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['stdout']
+        return state
+
+    def snapshot(self, path: str):
+        """
+        Write the whole VM to `path`: its loaded classes with their decoded
+        code and inline caches, static fields, class initialization and the
+        objects reachable from the statics. This VM must not be running, other
+        VMs sharing its loader wait for the snapshot before filling any cache.
+        """
+        with open(path, 'wb') as f, self.loader.lock:
+            SnapshotPickler(f, pickle.HIGHEST_PROTOCOL).dump(self)
+
+    @classmethod
+    def restore(cls, path: str, stdout: TextIO | None = None) -> "VM":
+        """load a VM written by `snapshot`, ready to run more code"""
+        with open(path, 'rb') as f:
+            vm = SnapshotUnpickler(f).load()
+        assert isinstance(vm, cls)
+        vm.stdout = stdout if stdout is not None else sys.stdout
+        vm.heap.recount(vm.statics.values())
+        return vm
+
+    def load_class(self, name: bytes) -> ClassFile:
+        return self.loader.load(name)
+
+    def initialize(self, klass: ClassFile):
+        name = klass.class_name
+        match self.class_states.get(name, InitializationState.verified):
+            case InitializationState.in_progress | InitializationState.done:
+                return
+            case InitializationState.error:
+                raise ValueError(f'NoClassDefFoundError: {name.decode()}')
+        self.class_states[name] = InitializationState.in_progress
+        try:
+            if Access.INTERFACE not in klass.access_flags and (superclass := klass.superclass) is not None:
+                self.initialize(superclass)
+        except Exception:
+            self.class_states[name] = InitializationState.error
+            raise
+        statics = self.statics[name] = {}
+        for field in klass.fields:
+            if Access.STATIC in field.access_flags:
+                statics[klass.get_const(field.name_index, Utf8Info).bytes] = None
+        for field_name, value in klass.static_fields.items():
+            statics[field_name] = value.initial(self) if isinstance(value, StaticField) else value
+        # [init] = klass.methods_by_name(b'<clinit>')
+        # init.run(self, deque(), [])
+        self.class_states[name] = InitializationState.done
+
+    def get_static(self, klass: ClassFile, name: bytes):
+        self.initialize(klass)
+        statics = self.statics[klass.class_name]
+        if name in statics:
+            return statics[name]
+        raise AttributeError(f'{klass.class_name.decode()}.{name.decode()}')
+
+    def new_instance(self, klass: ClassFile) -> Instance:
+        self.initialize(klass)
+        return self.heap.allocate(klass)
+
+    def main_frame(self, class_name: bytes, args: Iterable[str] = ()) -> Frame:
+        klass = self.load_class(class_name)
+        self.initialize(klass)
+        [main] = [m for m in klass.methods_by_name(b'main') if Access.STATIC in m.access_flags]
+        return main.execute(self, deque(), [StackEntry(StackTag.Reference, list(args))])
+
+    def run_main(self, class_name: bytes, args: Iterable[str] = ()):
+        """run a program to completion, async natives get an event loop of their own"""
+        frame = self.main_frame(class_name, args)
+        send: Any = frame.send
+        value: Any = None
+        while True:
+            try:
+                request = send(value)
+            except StopIteration:
+                return
+            send, value = frame.send, None
+            if request is not None:
+                try:
+                    value = asyncio.run(awaited(request))
+                except Exception as e:
+                    send, value = frame.throw, e
+
+    async def run_main_async(self, class_name: bytes, args: Iterable[str] = ()):
+        """
+        run a program as an asyncio task, handing control back to the event
+        loop every `instruction_budget` instructions and while async natives
+        wait, so it can be cancelled or timed out like any other task
+        """
+        frame = self.main_frame(class_name, args)
+        send: Any = frame.send
+        value: Any = None
+        while True:
+            try:
+                request = send(value)
+            except StopIteration:
+                return
+            send, value = frame.send, None
+            try:
+                if request is None:
+                    await asyncio.sleep(0)
+                else:
+                    value = await request
+            except Exception as e:
+                send, value = frame.throw, e
+
+
+class SnapshotPickler(pickle.Pickler):
+    """stores the built in classes and their natives by name, they are recreated on import anyway"""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, FakeClass):
+            return 'class', obj.class_name
+        if isinstance(obj, FakeMethod):
+            assert obj.klass
+            index = next(i for i, m in enumerate(obj.klass.methods) if m is obj)
+            return 'method', obj.klass.class_name, index
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        match pid:
+            case 'class', name:
+                return fake_classes[name]
+            case 'method', name, index:
+                return fake_classes[name].methods[index]
+        raise pickle.UnpicklingError(f'unknown persistent id {pid!r}')
+
+
+async def awaited(awaitable: Awaitable):
+    return await awaitable